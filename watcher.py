@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 
+import array
+import mmap
 import os
+import queue
 import re
+import sys
+import threading
 import time
 import requests
-from collections import deque
-from datetime import datetime, timedelta
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from collections import defaultdict
+from requests.adapters import HTTPAdapter
 
 LOG_FILE = os.getenv("LOG_FILE", "/var/log/nginx/custom_access.log")
 WINDOW_SIZE = int(os.getenv("WINDOW_SIZE", "200"))
@@ -15,60 +18,162 @@ ERROR_THRESHOLD = float(os.getenv("ERROR_RATE_THRESHOLD", "2.0")) / 100.0
 ALERT_COOLDOWN = int(os.getenv("ALERT_COOLDOWN_SEC", "300"))
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
 
+# The threshold never changes after startup, so format it once
+_THRESHOLD_PCT_STR = f"{ERROR_THRESHOLD*100:.2f}%"
+
+# Fields worth keeping from the space-separated key=value log format.
+# Plain split/partition beats regex for this shape of input. Keys are
+# bytes because the log is read in binary mode; only the handful of
+# matched values ever get decoded.
+_WANTED = {
+    b'pool': 'pool',
+    b'release': 'release',
+    b'upstream_status': 'upstream_status',
+    b'upstream': 'upstream',
+    b'request_time': 'request_time',
+    b'upstream_response_time': 'upstream_response_time'
+}
+
+# Bulk patterns for startup replay over the raw bytes of the whole file
+_STATUS_BULK_RE = re.compile(rb'upstream_status=(\d+)')
+_POOL_BULK_RE = re.compile(rb'pool=(\w+)')
+
+# Alert body has a fixed schema, so the labels live in one template
+# filled per alert with format_map
+_ALERT_TMPL = (
+    "{msg}\nTime: {ts}\n\n"
+    "Details:\n"
+    "- Pool: {pool}\n"
+    "- Release: {release}\n"
+    "- Upstream: {upstream}\n"
+    "- Upstream Status: {upstream_status}\n"
+    "- Request Time: {request_time}s\n"
+    "- Upstream Response Time: {upstream_response_time}s"
+)
+
+class ErrorWindow:
+    """Sliding window over recent requests with an O(1) running error count
+
+    Backed by a fixed array.array('b') ring buffer - one byte per slot
+    instead of a deque of boxed bools, so the whole window stays in a
+    few cache lines."""
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = array.array('b', bytes(size))
+        self.head = 0
+        self.filled = 0
+        self.errors = 0
+
+    def add(self, is_error):
+        is_error = 1 if is_error else 0
+        if self.filled == self.size:
+            self.errors -= self.buf[self.head]
+        else:
+            self.filled += 1
+        self.buf[self.head] = is_error
+        self.head = (self.head + 1) % self.size
+        self.errors += is_error
+
+    def __len__(self):
+        return self.filled
+
+
 # State tracking
-request_window = deque(maxlen=WINDOW_SIZE)
+request_window = ErrorWindow(WINDOW_SIZE)
 current_pool = None
 last_failover_alert = 0
 last_error_alert = 0
 file_position = 0
+_log_fp = None  # Persistent handle with a 64 KB read buffer
+_log_ino = None  # Inode of the open file, to detect rotation
 last_parsed_data = {}
 is_startup = True  # Flag to prevent alerts during initial log processing
+_slack_queue = queue.Queue(maxsize=100)  # Alerts awaiting delivery
 
 
 def get_current_time():
     """Get current time in UTC+1 timezone"""
-    return (datetime.utcnow() + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() + 3600))
 
 
 def parse_log_line(line):
-    """Extract all relevant fields from log line"""
+    """Extract all relevant fields from a raw log line (bytes)"""
     try:
-        pool_match = re.search(r'pool=(\w+)', line)
-        release_match = re.search(r'release=([\w\.\-]+)', line)
-        status_match = re.search(r'upstream_status=(\d+)', line)
-        upstream_match = re.search(r'upstream=([\d\.:]+)', line)
-        request_time_match = re.search(r'request_time=([\d\.]+)', line)
-        upstream_time_match = re.search(r'upstream_response_time=([\d\.]+)', line)
-        
-        if pool_match and status_match:
+        fields = {
+            'pool': None,
+            'release': b'unknown',
+            'upstream_status': None,
+            'upstream': b'unknown',
+            'request_time': b'0',
+            'upstream_response_time': b'0'
+        }
+
+        for token in line.split():
+            key, _, value = token.partition(b'=')
+            name = _WANTED.get(key)
+            # nginx logs "-" for fields with no upstream; treat as missing
+            if name and value and value != b'-':
+                fields[name] = value
+
+        if fields['pool'] and fields['upstream_status']:
+            # With proxy_next_upstream, retried requests log multi-valued
+            # fields like "upstream_status=502, 200" - split() leaves the
+            # first value with a trailing comma, so keep what precedes it
+            # (the upstream that triggered the retry)
             return {
-                'pool': pool_match.group(1),
-                'release': release_match.group(1) if release_match else 'unknown',
-                'upstream_status': int(status_match.group(1)),
-                'upstream': upstream_match.group(1) if upstream_match else 'unknown',
-                'request_time': request_time_match.group(1) if request_time_match else '0',
-                'upstream_response_time': upstream_time_match.group(1) if upstream_time_match else '0'
+                'pool': fields['pool'].decode(),
+                'release': fields['release'].decode(),
+                'upstream_status': int(fields['upstream_status'].partition(b',')[0]),
+                'upstream': fields['upstream'].partition(b',')[0].decode(),
+                'request_time': fields['request_time'].decode(),
+                'upstream_response_time': fields['upstream_response_time'].partition(b',')[0].decode()
             }
     except Exception as e:
         print(f"[DEBUG] Parse error: {e}")
-    
+
     return None
 
 
+def _slack_worker():
+    """Deliver queued alerts so log processing never blocks on network I/O"""
+    # One webhook host, one kept-alive connection - avoids a fresh
+    # DNS + TCP + TLS handshake per alert
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    while True:
+        alert_text = _slack_queue.get()
+        try:
+            response = session.post(
+                SLACK_WEBHOOK_URL,
+                json={"text": alert_text},
+                timeout=10
+            )
+            if response.status_code == 200:
+                print("[INFO] Slack alert sent successfully")
+            else:
+                print(f"[ERROR] Slack failed: {response.status_code}")
+        except Exception as e:
+            print(f"[ERROR] Failed to send Slack alert: {e}")
+        finally:
+            _slack_queue.task_done()
+
+
+threading.Thread(target=_slack_worker, daemon=True).start()
+
+
 def send_slack_alert(message, parsed_data=None):
     timestamp = get_current_time()
     
-    # Build detailed message
-    alert_text = f"{message}\nTime: {timestamp}"
-    
+    # Build detailed message in a single allocation
     if parsed_data:
-        alert_text += f"\n\nDetails:"
-        alert_text += f"\n- Pool: {parsed_data.get('pool', 'unknown')}"
-        alert_text += f"\n- Release: {parsed_data.get('release', 'unknown')}"
-        alert_text += f"\n- Upstream: {parsed_data.get('upstream', 'unknown')}"
-        alert_text += f"\n- Upstream Status: {parsed_data.get('upstream_status', 'unknown')}"
-        alert_text += f"\n- Request Time: {parsed_data.get('request_time', '0')}s"
-        alert_text += f"\n- Upstream Response Time: {parsed_data.get('upstream_response_time', '0')}s"
+        values = defaultdict(lambda: 'unknown', parsed_data)
+        values['msg'] = message
+        values['ts'] = timestamp
+        alert_text = _ALERT_TMPL.format_map(values)
+    else:
+        alert_text = f"{message}\nTime: {timestamp}"
     
     print(f"[ALERT] {message}")
     if parsed_data:
@@ -79,19 +184,11 @@ def send_slack_alert(message, parsed_data=None):
     if not SLACK_WEBHOOK_URL:
         print("[WARN] SLACK_WEBHOOK_URL not set, skipping Slack notification")
         return
-    
+
     try:
-        response = requests.post(
-            SLACK_WEBHOOK_URL,
-            json={"text": alert_text},
-            timeout=10
-        )
-        if response.status_code == 200:
-            print("[INFO] Slack alert sent successfully")
-        else:
-            print(f"[ERROR] Slack failed: {response.status_code}")
-    except Exception as e:
-        print(f"[ERROR] Failed to send Slack alert: {e}")
+        _slack_queue.put_nowait(alert_text)
+    except queue.Full:
+        print("[WARN] Slack queue full, dropping alert")
 
 
 def check_failover(parsed_data):
@@ -138,7 +235,7 @@ def check_error_rate():
         return  # Need minimum sample size
     
     total = len(request_window)
-    errors = sum(request_window)
+    errors = request_window.errors
     error_rate = errors / total
     current_time = time.time()
     time_since_last = current_time - last_error_alert
@@ -157,13 +254,13 @@ def check_error_rate():
             message = (
                 f"HIGH ERROR RATE DETECTED\n"
                 f"Error Rate: {error_rate*100:.2f}%\n"
-                f"Threshold: {ERROR_THRESHOLD*100:.2f}%\n"
+                f"Threshold: {_THRESHOLD_PCT_STR}\n"
                 f"Errors: {errors}/{total} requests\n"
                 f"Current Pool: {current_pool}"
             )
             send_slack_alert(message, last_parsed_data)
             last_error_alert = current_time
-            print(f"[WARN] High error rate: {error_rate*100:.2f}% (threshold: {ERROR_THRESHOLD*100:.2f}%)")
+            print(f"[WARN] High error rate: {error_rate*100:.2f}% (threshold: {_THRESHOLD_PCT_STR})")
         else:
             remaining = int(ALERT_COOLDOWN - time_since_last)
             print(f"[WARN] Error rate {error_rate*100:.2f}% ABOVE THRESHOLD (COOLDOWN ACTIVE, {remaining}s remaining)")
@@ -174,39 +271,112 @@ def check_error_rate():
                 print(f"[INFO] Error rate recovered to {error_rate*100:.2f}% (cooldown cleared)")
 
 
+def replay_existing(file_path):
+    """Bulk-process historical log lines at startup
+
+    Memory-maps the file and extracts every upstream_status with a
+    single bulk findall over the mapped bytes instead of running
+    parse_log_line per line - no read copies, and the kernel pages the
+    file in on demand. Only the last WINDOW_SIZE statuses matter for
+    the window."""
+    global file_position, current_pool, last_parsed_data
+
+    try:
+        with open(file_path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return  # Empty file, nothing to replay
+    except FileNotFoundError:
+        print(f"[WARN] Log file not found: {file_path}")
+        return
+
+    try:
+        statuses = _STATUS_BULK_RE.findall(mm)
+        for raw in statuses[-WINDOW_SIZE:]:
+            request_window.add(int(raw) // 100 == 5)
+
+        # Current pool is whatever the tail of the log last reported
+        tail = mm[-4096:]
+        pools = _POOL_BULK_RE.findall(tail)
+        if pools:
+            current_pool = pools[-1].decode()
+
+        # Seed the alert context from the last parseable historical line
+        # so the first alert after startup carries its Details block
+        for raw_line in reversed(tail.splitlines()):
+            parsed_data = parse_log_line(raw_line)
+            if parsed_data:
+                last_parsed_data = parsed_data
+                break
+
+        file_position = len(mm)
+    finally:
+        mm.close()
+
+
 def process_new_lines(file_path):
     """Read and process new lines from log file"""
-    global file_position
-    
+    global file_position, _log_fp, _log_ino
+
     try:
-        with open(file_path, 'r') as f:
-            f.seek(file_position)
-            
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                parsed_data = parse_log_line(line)
-                
-                if parsed_data:
-                    # Display parsed fields
-                    print(f"[LOG] pool={parsed_data['pool']} "
-                          f"release={parsed_data['release']} "
-                          f"upstream_status={parsed_data['upstream_status']} "
-                          f"upstream={parsed_data['upstream']}")
-                    
-                    # Check for failover
-                    check_failover(parsed_data)
-                    
-                    # Track 5xx errors in sliding window
-                    is_error = 500 <= parsed_data['upstream_status'] < 600
-                    request_window.append(is_error)
-                    
-                    # Check error rate after each request
+        # Open once and keep the handle resident; reopen only if the
+        # inode changed (log rotation)
+        inode = os.stat(file_path).st_ino
+        if _log_fp is None or inode != _log_ino:
+            if _log_fp is not None:
+                _log_fp.close()
+                file_position = 0  # Rotated: restart from the top
+            _log_fp = open(file_path, 'rb', buffering=65536)
+            _log_ino = inode
+            _log_fp.seek(file_position)
+
+        f = _log_fp
+        lines_processed = 0
+        bytes_consumed = 0
+        out_buf = []
+
+        for line in f:
+            bytes_consumed += len(line)
+            if line.endswith(b'\n'):
+                line = line[:-1]
+            if not line:
+                continue
+
+            parsed_data = parse_log_line(line)
+
+            if parsed_data:
+                # Buffer the per-line output and flush in batches so the
+                # hot loop is not paying a stdout lock + flush per line
+                if not is_startup:
+                    out_buf.append(f"[LOG] pool={parsed_data['pool']} "
+                                   f"release={parsed_data['release']} "
+                                   f"upstream_status={parsed_data['upstream_status']} "
+                                   f"upstream={parsed_data['upstream']}\n")
+                    if len(out_buf) >= 100:
+                        sys.stdout.write(''.join(out_buf))
+                        out_buf.clear()
+
+                # Check for failover
+                check_failover(parsed_data)
+
+                # Track 5xx errors in sliding window
+                is_error = parsed_data['upstream_status'] // 100 == 5
+                request_window.add(is_error)
+
+                # Check error rate every 64 requests (skipped during
+                # startup replay, once after the loop covers the batch)
+                lines_processed += 1
+                if not is_startup and lines_processed % 64 == 0:
                     check_error_rate()
-            
-            file_position = f.tell()
+
+        if out_buf:
+            sys.stdout.write(''.join(out_buf))
+
+        if lines_processed:
+            check_error_rate()
+
+        file_position += bytes_consumed
     
     except FileNotFoundError:
         print(f"[WARN] Log file not found: {file_path}")
@@ -214,14 +384,6 @@ def process_new_lines(file_path):
         print(f"[ERROR] Failed to read log: {e}")
 
 
-class LogHandler(FileSystemEventHandler):
-    """Watchdog event handler for log file changes"""
-    
-    def on_modified(self, event):
-        if LOG_FILE in event.src_path:
-            process_new_lines(LOG_FILE)
-
-
 def main():
     global is_startup
     
@@ -230,7 +392,7 @@ def main():
     print("=" * 60)
     print(f"Log file: {LOG_FILE}")
     print(f"Window size: {WINDOW_SIZE} requests")
-    print(f"Error threshold: {ERROR_THRESHOLD*100:.2f}%")
+    print(f"Error threshold: {_THRESHOLD_PCT_STR}")
     print(f"Alert cooldown: {ALERT_COOLDOWN}s ({ALERT_COOLDOWN//60} minutes)")
     print(f"Slack webhook: {'configured' if SLACK_WEBHOOK_URL else 'NOT SET'}")
     print(f"Current time: {get_current_time()}")
@@ -245,11 +407,11 @@ def main():
     
     # Process existing lines first (startup mode - no alerts)
     is_startup = True
-    process_new_lines(LOG_FILE)
+    replay_existing(LOG_FILE)
     
     print(f"[INFO] Processed {len(request_window)} existing requests")
     if len(request_window) > 0:
-        errors = sum(request_window)
+        errors = request_window.errors
         error_rate = errors / len(request_window)
         print(f"[INFO] Initial error rate: {error_rate*100:.2f}% ({errors}/{len(request_window)})")
     print(f"[INFO] Current pool: {current_pool}")
@@ -260,22 +422,16 @@ def main():
     print("[INFO] Startup complete. Now monitoring for NEW events...")
     print("=" * 60)
     
-    # Start watching for changes
-    event_handler = LogHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=os.path.dirname(LOG_FILE), recursive=False)
-    observer.start()
-    
+    # Tail the file directly - a bounded poll loop is cheaper than a
+    # watchdog observer thread for a single file
     print("[INFO] Watching for log changes...")
-    
+
     try:
         while True:
-            time.sleep(1)
+            process_new_lines(LOG_FILE)
+            time.sleep(0.1)
     except KeyboardInterrupt:
         print("\n[INFO] Shutting down...")
-        observer.stop()
-    
-    observer.join()
 
 
 if __name__ == "__main__":